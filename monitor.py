@@ -14,26 +14,25 @@ Requirements:
 """
 
 import mmap
-import ctypes
+import re
+import struct
 import time
-import csv
 import datetime
 import os
 import argparse
-from dotenv import load_dotenv
+import numpy as np
 
-# Load environment variables
-load_dotenv()
-
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='HWiNFO Shared Memory Monitor')
-parser.add_argument('--run-id', type=str, default=None, help='Unique run ID to include in CSV')
-args = parser.parse_args()
+# Load environment variables, skipping the dotenv import and filesystem
+# scan entirely when there is no .env to read
+if os.path.exists('.env'):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # =========================================================
 # HWiNFO Shared Memory Constants and Structs
 # =========================================================
 HWINFO_SENSORS_MAP_FILE_NAME = "Global\\HWiNFO_SENS_SM2"
+HWINFO_SHM_SIZE = 500000
 LOG_FILE = os.getenv("HWINFO_LOG_FILE", r"hwinfo_log.csv")
 
 # =========================================================
@@ -69,113 +68,150 @@ TARGET_KEYWORDS = [
     "NPU"               # Will capture any NPU metrics if they appear
 ]
 
+# All keywords compiled into a single bytes alternation so the filter is
+# one C-level scan per label instead of one substring search per keyword.
+_KW_RE = re.compile(b'|'.join(re.escape(k.encode('latin-1')) for k in TARGET_KEYWORDS))
+
+# (dwSensorIndex, dwReadingID) -> formatted CSV key, or None for readings
+# that failed the keyword filter. HWiNFO reports a stationary sensor set,
+# so after the first poll the scan is pure numeric extraction.
+_LABEL_CACHE = {}
+
+# (element_size, reading_offset, num_readings) from the first validated
+# header; the layout is invariant while HWiNFO runs.
+_cached_header = None
+
+# Gather plan recorded on the first full scan: the element positions of
+# matching readings plus their formatted keys. Steady-state polls become a
+# single vectorized gather instead of a per-element Python loop.
+_extract_plan = None
+
 # =========================================================
 # HWiNFO Structures
 # =========================================================
-class HWiNFO_Header(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("Signature", ctypes.c_char * 4),
-        ("Version", ctypes.c_uint32),
-        ("Revision", ctypes.c_uint32),
-        ("PollTime", ctypes.c_int64),
-        ("OffsetOfSensorSection", ctypes.c_uint32),
-        ("SizeOfSensorElement", ctypes.c_uint32),
-        ("NumSensorElements", ctypes.c_uint32),
-        ("OffsetOfReadingSection", ctypes.c_uint32),
-        ("SizeOfReadingElement", ctypes.c_uint32),
-        ("NumReadingElements", ctypes.c_uint32)
-    ]
-
-class HWiNFO_Element_460(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("tReading", ctypes.c_uint32),
-        ("dwSensorIndex", ctypes.c_uint32),
-        ("dwReadingID", ctypes.c_uint32),
-        ("szLabelOrig", ctypes.c_char * 128),
-        ("szLabelUser", ctypes.c_char * 128),
-        ("szUnit", ctypes.c_char * 16),
-        ("Value", ctypes.c_double),
-        ("ValueMin", ctypes.c_double),
-        ("ValueMax", ctypes.c_double),
-        ("ValueAvg", ctypes.c_double),
-        ("Padding", ctypes.c_ubyte * (460 - 320))
-    ]
-
-class HWiNFO_Element_320(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("tReading", ctypes.c_uint32),
-        ("dwSensorIndex", ctypes.c_uint32),
-        ("dwReadingID", ctypes.c_uint32),
-        ("szLabelOrig", ctypes.c_char * 128),
-        ("szLabelUser", ctypes.c_char * 128),
-        ("szUnit", ctypes.c_char * 16),
-        ("Value", ctypes.c_double),
-        ("ValueMin", ctypes.c_double),
-        ("ValueMax", ctypes.c_double),
-        ("ValueAvg", ctypes.c_double)
-    ]
-
-class HWiNFO_Element_252(ctypes.Structure):
-    _pack_ = 1
-    _fields_ = [
-        ("tReading", ctypes.c_uint32),
-        ("dwSensorIndex", ctypes.c_uint32),
-        ("dwReadingID", ctypes.c_uint32),
-        ("szLabelOrig", ctypes.c_char * 96),
-        ("szLabelUser", ctypes.c_char * 96),
-        ("szUnit", ctypes.c_char * 16),
-        ("Value", ctypes.c_double),
-        ("ValueMin", ctypes.c_double),
-        ("ValueMax", ctypes.c_double),
-        ("ValueAvg", ctypes.c_double)
-    ]
+# Signature, Version, Revision, PollTime, OffsetOfSensorSection,
+# SizeOfSensorElement, NumSensorElements, OffsetOfReadingSection,
+# SizeOfReadingElement, NumReadingElements. Unpacked in place over the
+# mmap, so the header is never copied out of shared memory.
+_HEADER_STRUCT = struct.Struct('<4sIIqIIIIII')
+
+def _element_dtype(element_size):
+    """Structured dtype matching one HWiNFO reading element of the given size.
+
+    Layout: tReading, dwSensorIndex, dwReadingID, szLabelOrig, szLabelUser,
+    szUnit, Value, ValueMin, ValueMax, ValueAvg. The 252-byte variant uses
+    96-byte labels; itemsize covers any trailing padding so the dtype strides
+    straight through the reading section.
+    """
+    label_w = 96 if element_size == 252 else 128
+    vals = 12 + 2 * label_w + 16
+    return np.dtype({
+        'names': ['tReading', 'sensor', 'rid', 'label', 'user', 'unit',
+                  'val', 'vmin', 'vmax', 'vavg'],
+        'formats': ['<u4', '<u4', '<u4', 'S%d' % label_w, 'S%d' % label_w,
+                    'S16', '<f8', '<f8', '<f8', '<f8'],
+        'offsets': [0, 4, 8, 12, 12 + label_w, 12 + 2 * label_w,
+                    vals, vals + 8, vals + 16, vals + 24],
+        'itemsize': element_size,
+    })
+
+_ELEM_DTYPES = {size: _element_dtype(size) for size in (460, 320, 252)}
 
 # =========================================================
 # Functions
 # =========================================================
 
-def get_hwinfo_data():
+def open_hwinfo_shm():
+    """Maps the HWiNFO shared-memory region once; returns an mmap or None."""
+    try:
+        shm = mmap.mmap(-1, HWINFO_SHM_SIZE, tagname=HWINFO_SENSORS_MAP_FILE_NAME, access=mmap.ACCESS_READ)
+    except Exception:
+        return None
+
+    # Touch one byte per 4 KB page so every first-touch page fault is paid
+    # here, at map time, instead of spiking the first poll.
+    for off in range(0, HWINFO_SHM_SIZE, 4096):
+        shm[off]
+    return shm
+
+def get_hwinfo_data(shm):
     """Reads shared memory and returns a dictionary of filtered metrics."""
+    global _cached_header, _extract_plan
     metrics = {}
     try:
-        shm = mmap.mmap(-1, 500000, tagname=HWINFO_SENSORS_MAP_FILE_NAME, access=mmap.ACCESS_READ)
-        header = HWiNFO_Header.from_buffer_copy(shm.read(ctypes.sizeof(HWiNFO_Header)))
-
-        if header.Signature != b'HWiS':
-             shm.close()
-             return None
-
-        # Select Structure based on size from header
-        element_size = header.SizeOfReadingElement
-        if element_size == 460: element_struct = HWiNFO_Element_460
-        elif element_size == 320: element_struct = HWiNFO_Element_320
-        elif element_size == 252: element_struct = HWiNFO_Element_252
+        # HWiNFO updates the same region in place; all access below uses
+        # absolute offsets against the persistent mapping.
+        if _cached_header is None:
+            (signature, _version, _revision, _poll_time,
+             _sensor_offset, _sensor_size, _num_sensors,
+             reading_offset, element_size,
+             num_readings) = _HEADER_STRUCT.unpack_from(shm, 0)
+
+            if signature != b'HWiS':
+                 return None
+
+            # Select element layout based on size from header
+            if element_size not in _ELEM_DTYPES:
+                return None
+            _cached_header = (element_size, reading_offset, num_readings)
         else:
-            shm.close()
-            return None
-
-        shm.seek(header.OffsetOfReadingSection)
-
-        for _ in range(header.NumReadingElements):
-            block = shm.read(element_size)
-            element = element_struct.from_buffer_copy(block)
-
-            try:
-                label = element.szLabelUser.decode('latin-1').strip('\x00')
-                unit = element.szUnit.decode('latin-1').strip('\x00')
-            except:
-                continue
-
-            if element.tReading != 0 and label:
-                # Check if this sensor is in our target list
-                if any(k in label for k in TARGET_KEYWORDS):
-                    full_key = f"{label} [{unit}]" if unit else label
-                    metrics[full_key] = element.Value
-
-        shm.close()
+            # Re-check only the 4-byte signature so an HWiNFO restart is
+            # still detected; the layout fields don't change while it runs.
+            if shm[0:4] != b'HWiS':
+                _cached_header = None
+                _extract_plan = None
+                return None
+
+        element_size, reading_offset, num_readings = _cached_header
+        elem_dtype = _ELEM_DTYPES[element_size]
+
+        # One zero-copy view over the whole reading section.
+        readings = np.frombuffer(shm, dtype=elem_dtype,
+                                 count=num_readings,
+                                 offset=reading_offset)
+
+        # Steady state: the positions of matching readings were recorded on
+        # the first full scan, so extraction is one vectorized gather with
+        # no per-element Python work at all.
+        if _extract_plan is not None:
+            plan_idx, plan_keys = _extract_plan
+            return dict(zip(plan_keys, readings['val'][plan_idx].tolist()))
+
+        # First full scan: resolve labels, build the metrics dict and record
+        # the gather plan for every poll after this one.
+        plan_idx = []
+        plan_keys = []
+        for pos in np.flatnonzero(readings['tReading'] != 0):
+            rec = readings[pos]
+            cache_key = (int(rec['sensor']), int(rec['rid']))
+            if cache_key in _LABEL_CACHE:
+                full_key = _LABEL_CACHE[cache_key]
+            else:
+                # NumPy S-fields come back with trailing NULs stripped.
+                full_key = None
+                label_b = rec['user']
+                if label_b and _KW_RE.search(label_b) is not None:
+                    try:
+                        # Labels are plain ASCII, which has the fastest
+                        # codec path; units stay latin-1 for characters
+                        # like the degree sign in temperature readings.
+                        label = label_b.decode('ascii')
+                        unit = rec['unit'].decode('latin-1')
+                        full_key = f"{label} [{unit}]" if unit else label
+                    except:
+                        pass
+                _LABEL_CACHE[cache_key] = full_key
+
+            if full_key is not None:
+                plan_idx.append(pos)
+                plan_keys.append(full_key)
+                metrics[full_key] = float(rec['val'])
+
+        # Don't freeze an empty plan: a valid signature can show up before
+        # the readings are populated (or before any keyword matches), and
+        # pinning an empty gather would lock every later poll to {}.
+        if plan_idx:
+            _extract_plan = (np.asarray(plan_idx, dtype=np.intp), plan_keys)
         return metrics
 
     except Exception:
@@ -188,6 +224,11 @@ def safe_fmt(val):
     return str(val)
 
 def main():
+    # Parse arguments here so importing this module doesn't touch argv
+    parser = argparse.ArgumentParser(description='HWiNFO Shared Memory Monitor')
+    parser.add_argument('--run-id', type=str, default=None, help='Unique run ID to include in CSV')
+    args = parser.parse_args()
+
     run_id = args.run_id
     print(f"Monitoring started. Logging to {LOG_FILE}...")
     if run_id:
@@ -195,29 +236,47 @@ def main():
     print("Press Ctrl+C to stop.\n")
 
     csv_headers = None
+    log_file = None
+    row_fmt = None
+    shm = None
+
+    # Drift-corrected cadence: sleeping a fixed 5s after each poll would
+    # stretch the period by however long the poll itself took.
+    POLL_INTERVAL = 5.0
+    next_poll = time.monotonic()
 
     try:
         while True:
             timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-            data = get_hwinfo_data()
+
+            if shm is None:
+                shm = open_hwinfo_shm()
+
+            data = get_hwinfo_data(shm) if shm is not None else None
+            if data is None and shm is not None:
+                # HWiNFO probably restarted; drop the stale mapping and remap
+                # on the next poll.
+                shm.close()
+                shm = None
 
             if data:
                 row_data = {"Run_ID": run_id or "N/A", "Time": timestamp}
                 row_data.update(data)
 
-                # Setup CSV header if first run
+                # Open the log once with a large buffer; reopening per sample
+                # costs two syscalls per row and defeats buffering.
                 if csv_headers is None:
                     csv_headers = list(row_data.keys())
-                    with open(LOG_FILE, 'w', newline='') as f:
-                        writer = csv.DictWriter(f, fieldnames=csv_headers)
-                        writer.writeheader()
+                    log_file = open(LOG_FILE, 'w', newline='', buffering=1 << 16)
+                    log_file.write(','.join(csv_headers) + '\n')
+                    # Keys and values are fixed-format (labels, floats), so
+                    # CSV quoting never applies; a precomputed format string
+                    # beats the csv module's per-field state machine.
+                    row_fmt = ','.join(['{}'] * len(csv_headers)) + '\n'
 
-                # Append data to CSV
-                with open(LOG_FILE, 'a', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=csv_headers)
-                    # Use dictionary matching to safely write row
-                    clean_row = {k: row_data.get(k, '') for k in csv_headers}
-                    writer.writerow(clean_row)
+                # Build the row in header order; sensors missing from this
+                # poll become empty cells.
+                log_file.write(row_fmt.format(*[row_data.get(k, '') for k in csv_headers]))
 
                 # --- Safe Console Summary ---
                 # We prioritize specific sensors for the live view
@@ -246,10 +305,21 @@ def main():
             else:
                 print("Error reading HWiNFO. Is it running?")
 
-            time.sleep(5)
+            next_poll += POLL_INTERVAL
+            delay = next_poll - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind; realign rather than bursting to catch up.
+                next_poll = time.monotonic()
 
     except KeyboardInterrupt:
         print(f"\nStopped. Data saved to {LOG_FILE}")
+    finally:
+        if shm is not None:
+            shm.close()
+        if log_file is not None:
+            log_file.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
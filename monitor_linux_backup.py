@@ -7,22 +7,84 @@ Monitors CPU, Memory, and GPU utilization using qmassa for comprehensive GPU sta
 import psutil
 import time
 import argparse
+import atexit
 import csv
-from datetime import datetime
+import struct
 import os
+from datetime import datetime
 import subprocess
 import json
 import shutil
+import signal
 import sys
 import tempfile
+import threading
+import queue
+import glob
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bytes -> MB as a multiply; a division per tick (and per GPU memory
+# field) adds up at sub-second sampling rates
+_MB = 1.0 / (1024 * 1024)
+
+# Userspace buffer for the output CSV; with batched writes and the
+# queue-fed flushes, a big buffer means write() syscalls only every few
+# batches rather than every batch
+_FILE_BUFFER = 1 << 20
+
+# qmassa reports the same engine/sensor names every tick, so sanitized
+# forms are memoized; the translate table folds the three replace() passes
+# into one scan for the cache-miss case
+_NAME_TABLE = str.maketrans('/- ', '___')
+_CLEAN_NAME_CACHE = {}
+
+
+def _clean_name(name):
+    """Sanitizes a qmassa engine/sensor name into a CSV column fragment."""
+    clean = _CLEAN_NAME_CACHE.get(name)
+    if clean is None:
+        clean = name.translate(_NAME_TABLE).lower()
+        _CLEAN_NAME_CACHE[name] = clean
+    return clean
+
+
+# strftime only needs to rerun when the integer second changes; between
+# ticks the prefix is reused and just the microseconds are formatted
+_last_ts_sec = 0
+_last_ts_prefix = ''
+
+
+def _fast_timestamp():
+    """ISO-format local timestamp without a datetime object per tick."""
+    global _last_ts_sec, _last_ts_prefix
+    ns = time.time_ns()
+    secs = ns // 1_000_000_000
+    if secs != _last_ts_sec:
+        _last_ts_sec = secs
+        _last_ts_prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(secs))
+    return f"{_last_ts_prefix}.{(ns % 1_000_000_000) // 1000:06d}"
 
 
 def get_process_by_name(process_name):
     """Finds a running process by its name or command line."""
-    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+    needle = process_name.lower()
+
+    # Cheap pass first: only fetch names, so psutil doesn't open every
+    # process's cmdline just to match by name.
+    for proc in psutil.process_iter(['pid', 'name']):
         try:
-            if process_name.lower() in proc.info['name'].lower():
+            if needle in proc.info['name'].lower():
                 return proc
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+
+    # Fallback pass: no name matched, now pay for the cmdline reads.
+    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+        try:
             if proc.info['cmdline'] and any(process_name in s for s in proc.info['cmdline']):
                 return proc
         except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
@@ -30,117 +92,703 @@ def get_process_by_name(process_name):
     return None
 
 
-def get_gpu_stats_qmassa(temp_file):
+def _unlink_quiet(path):
+    """Removes path, ignoring a missing file (e.g. already cleaned up)."""
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _qmassa_needs_sudo():
+    """False when qmassa can read the GPU counters without sudo.
+
+    Running as root obviously qualifies; so does a qmassa binary carrying
+    cap_perfmon (or the broader cap_sys_admin) file capabilities. Probed
+    once at launch — skipping sudo avoids the PAM/audit round-trip and
+    works where passwordless sudo isn't configured at all.
     """
-    Capture a single snapshot of GPU stats using qmassa.
+    if os.geteuid() == 0:
+        return False
+    path = shutil.which('qmassa')
+    if path:
+        try:
+            caps = subprocess.run(['getcap', path], capture_output=True,
+                                  text=True, timeout=5).stdout
+            if 'cap_perfmon' in caps or 'cap_sys_admin' in caps:
+                return False
+        except (OSError, subprocess.SubprocessError):
+            pass
+    return True
+
+
+def start_qmassa(temp_file, interval):
+    """
+    Launch qmassa once as a long-lived child that keeps refreshing temp_file.
 
     Args:
-        temp_file: Path to temporary JSON file for qmassa output
+        temp_file: Path qmassa writes its JSON state to
+        interval: Desired refresh interval in seconds
 
     Returns:
-        dict with GPU metrics or None if capture failed
+        subprocess.Popen handle, or None if the launch failed
     """
+    cmd = ["qmassa", "-x", "-n", "0",
+           "-m", str(max(100, int(interval * 1000))), "-t", temp_file]
+    if _qmassa_needs_sudo():
+        cmd = ["sudo", "-n"] + cmd
     try:
-        # Run qmassa for a single iteration and save to JSON
-        result = subprocess.run(
-            ["sudo", "-n", "qmassa", "-x", "-n", "1", "-t", temp_file],
-            capture_output=True,
-            text=True,
-            timeout=5
+        return subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
         )
+    except (OSError, subprocess.SubprocessError):
+        return None
 
-        if result.returncode != 0:
-            return None
 
-        # Read and parse the JSON output
-        if not os.path.exists(temp_file):
+# qmassa can't refresh faster than ~4 Hz (its floor is -m 100); calls
+# arriving sooner than this after the last read get the cached snapshot
+# back instead of re-reading a file that hasn't changed
+MIN_GPU_INTERVAL = 0.25
+_last_gpu_read = 0.0
+_last_gpu_stats = None
+
+
+def get_gpu_stats_qmassa(temp_file):
+    """
+    Read the newest GPU snapshot from the long-lived qmassa child.
+
+    Reads are throttled to MIN_GPU_INTERVAL; a caller sampling faster
+    than qmassa can refresh gets the cached snapshot back.
+
+    Args:
+        temp_file: Path to the JSON file the qmassa child refreshes
+
+    Returns:
+        dict with GPU metrics or None if no snapshot is available yet
+    """
+    global _last_gpu_read, _last_gpu_stats
+    now = time.monotonic()
+    if now - _last_gpu_read < MIN_GPU_INTERVAL:
+        return _last_gpu_stats
+    _last_gpu_read = now
+    _last_gpu_stats = _read_gpu_stats_qmassa(temp_file)
+    return _last_gpu_stats
+
+
+def _read_gpu_stats_qmassa(temp_file):
+    """Uncached read: tail the last chunk of the JSON file for the newest
+    complete snapshot, so the per-read cost stays flat as the file grows.
+    """
+    try:
+        fd = os.open(temp_file, os.O_RDONLY)
+    except OSError:
+        return None
+
+    try:
+        size = os.fstat(fd).st_size
+        if size == 0:
             return None
+        tail_from = max(0, size - 16384)
+        tail = os.pread(fd, size - tail_from, tail_from)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    # Newest complete JSON line wins; a line cut off by the tail window or
+    # an in-progress qmassa write just falls through to the next candidate.
+    for line in reversed(tail.splitlines()):
+        line = line.strip()
+        if not line.startswith(b'{') or not line.endswith(b'}'):
+            continue
+        # Cheap substring check before paying for a full JSON parse, so
+        # version/config lines ahead of the data are skipped for free
+        if b'"devs_state"' not in line and b'"iterations"' not in line:
+            continue
+        try:
+            data = orjson.loads(line) if orjson is not None else json.loads(line)
+        except ValueError:
+            continue
+        gpu_stats = _extract_gpu_stats(data)
+        if gpu_stats:
+            return gpu_stats
+
+    # Fall back to parsing the whole file for qmassa builds that rewrite a
+    # single (possibly indented) JSON document in place.
+    try:
+        with open(temp_file, 'rb') as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except (OSError, ValueError):
+        return None
+    return _extract_gpu_stats(data)
 
-        with open(temp_file, 'r') as f:
-            data = json.load(f)
 
-        # Extract GPU stats from qmassa JSON
-        gpu_stats = {}
+def _extract_gpu_stats(data):
+    """Pulls the metric dict out of one parsed qmassa JSON state."""
+    gpu_stats = {}
 
+    try:
+        # Streaming states carry the device list directly (devs_state);
+        # single-document dumps wrap it in an iterations array.
         if 'iterations' in data and len(data['iterations']) > 0:
             latest = data['iterations'][-1]
+        else:
+            latest = data
 
-            # Get device stats (first GPU)
-            if 'devices' in latest and len(latest['devices']) > 0:
-                device = latest['devices'][0]
-
-                # Memory usage
-                if 'memory' in device:
-                    mem = device['memory']
-                    if 'system' in mem:
-                        gpu_stats['gpu_system_mem_used_mb'] = mem['system'].get('used', 0) / (1024 * 1024)
-                        gpu_stats['gpu_system_mem_total_mb'] = mem['system'].get('total', 0) / (1024 * 1024)
-                    if 'device' in mem:
-                        gpu_stats['gpu_vram_used_mb'] = mem['device'].get('used', 0) / (1024 * 1024)
-                        gpu_stats['gpu_vram_total_mb'] = mem['device'].get('total', 0) / (1024 * 1024)
-
-                # Engine utilization (sum all engines)
-                if 'engines' in device:
-                    total_util = 0
-                    engine_count = 0
-                    for engine_name, engine_data in device['engines'].items():
-                        if isinstance(engine_data, dict) and 'busy' in engine_data:
-                            total_util += engine_data['busy']
-                            engine_count += 1
-                            # Also store individual engine stats
-                            clean_name = engine_name.replace('/', '_').lower()
-                            gpu_stats[f'gpu_engine_{clean_name}_percent'] = engine_data['busy']
-
-                    if engine_count > 0:
-                        gpu_stats['gpu_total_utilization_percent'] = total_util / engine_count
-                    else:
-                        gpu_stats['gpu_total_utilization_percent'] = 0.0
-
-                # Frequency
-                if 'frequencies' in device:
-                    freq = device['frequencies']
-                    if isinstance(freq, dict):
-                        gpu_stats['gpu_freq_actual_mhz'] = freq.get('actual', 0)
-                        gpu_stats['gpu_freq_requested_mhz'] = freq.get('requested', 0)
-                        gpu_stats['gpu_freq_max_mhz'] = freq.get('max', 0)
-
-                # Power
-                if 'power' in device:
-                    pwr = device['power']
-                    if isinstance(pwr, dict):
-                        gpu_stats['gpu_power_watts'] = pwr.get('gpu', 0)
-                        gpu_stats['gpu_package_power_watts'] = pwr.get('package', 0)
-
-                # Temperature
-                if 'temperature' in device:
-                    temps = device['temperature']
-                    if isinstance(temps, dict):
-                        for temp_name, temp_val in temps.items():
-                            clean_name = temp_name.replace('-', '_').lower()
-                            gpu_stats[f'gpu_temp_{clean_name}_c'] = temp_val
-
-        # Clean up temp file
+        devices = latest.get('devices') or latest.get('devs_state') or []
+
+        # Get device stats (first GPU)
+        if len(devices) > 0:
+            device = devices[0]
+
+            # Memory usage
+            if 'memory' in device:
+                mem = device['memory']
+                if 'system' in mem:
+                    gpu_stats['gpu_system_mem_used_mb'] = mem['system'].get('used', 0) * _MB
+                    gpu_stats['gpu_system_mem_total_mb'] = mem['system'].get('total', 0) * _MB
+                if 'device' in mem:
+                    gpu_stats['gpu_vram_used_mb'] = mem['device'].get('used', 0) * _MB
+                    gpu_stats['gpu_vram_total_mb'] = mem['device'].get('total', 0) * _MB
+
+            # Engine utilization (sum all engines)
+            if 'engines' in device:
+                total_util = 0
+                engine_count = 0
+                for engine_name, engine_data in device['engines'].items():
+                    if isinstance(engine_data, dict) and 'busy' in engine_data:
+                        total_util += engine_data['busy']
+                        engine_count += 1
+                        # Also store individual engine stats
+                        clean_name = _clean_name(engine_name)
+                        gpu_stats[f'gpu_engine_{clean_name}_percent'] = engine_data['busy']
+
+                if engine_count > 0:
+                    gpu_stats['gpu_total_utilization_percent'] = total_util / engine_count
+                else:
+                    gpu_stats['gpu_total_utilization_percent'] = 0.0
+
+            # Frequency
+            if 'frequencies' in device:
+                freq = device['frequencies']
+                if isinstance(freq, dict):
+                    gpu_stats['gpu_freq_actual_mhz'] = freq.get('actual', 0)
+                    gpu_stats['gpu_freq_requested_mhz'] = freq.get('requested', 0)
+                    gpu_stats['gpu_freq_max_mhz'] = freq.get('max', 0)
+
+            # Power
+            if 'power' in device:
+                pwr = device['power']
+                if isinstance(pwr, dict):
+                    gpu_stats['gpu_power_watts'] = pwr.get('gpu', 0)
+                    gpu_stats['gpu_package_power_watts'] = pwr.get('package', 0)
+
+            # Temperature
+            if 'temperature' in device:
+                temps = device['temperature']
+                if isinstance(temps, dict):
+                    for temp_name, temp_val in temps.items():
+                        clean_name = _clean_name(temp_name)
+                        gpu_stats[f'gpu_temp_{clean_name}_c'] = temp_val
+
+    except (AttributeError, TypeError):
+        # Snapshot shape wasn't what we expected (e.g. truncated state)
+        return None
+
+    return gpu_stats if gpu_stats else None
+
+
+# Metric columns every qmassa/sysfs capture can produce, seeded into the
+# header up front so the common case never widens the schema (and never
+# rewrites the CSV) mid-run. Device-specific columns — per-engine
+# utilization, per-sensor temperatures, fan — still get discovered
+# dynamically during warm-up because their names vary by GPU.
+GPU_COLUMNS = (
+    'gpu_system_mem_used_mb', 'gpu_system_mem_total_mb',
+    'gpu_vram_used_mb', 'gpu_vram_total_mb',
+    'gpu_total_utilization_percent',
+    'gpu_freq_actual_mhz', 'gpu_freq_requested_mhz', 'gpu_freq_max_mhz',
+    'gpu_power_watts', 'gpu_package_power_watts',
+)
+
+
+class SysfsGpu:
+    """Direct sysfs GPU sampling, bypassing the qmassa subprocess.
+
+    The same engine-busy, frequency, temperature and power figures qmassa
+    collects are exposed by the drm and hwmon sysfs trees on Intel and AMD
+    GPUs. Every relevant file is resolved and opened once at construction;
+    each tick is then a handful of pread() calls on kept-open fds —
+    sub-millisecond, versus the fork/exec + sudo + qmassa startup the
+    subprocess path pays. Exposure varies by driver generation, so qmassa
+    stays as the fallback when the tree lacks the utilization fields.
+    """
+
+    def __init__(self):
+        # (column key, fd, scale factor applied to the raw integer)
+        self._fields = []
+        self._engine_keys = []
+        self.available = False
+        try:
+            self._probe()
+        except OSError:
+            self.close()
+        # Only prefer sysfs when the driver exposes engine busy counters.
+        # Frequency files alone resolve on essentially every Intel machine
+        # while utilization and memory don't, and choosing sysfs on that
+        # basis would flatline those columns for the whole run.
+        self.available = bool(self._engine_keys)
+
+    def _add(self, key, path, scale=1.0):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return False
+        self._fields.append((key, fd, scale))
+        return True
+
+    def _probe(self):
+        cards = sorted(glob.glob('/sys/class/drm/card[0-9]*/device/vendor'))
+        if not cards:
+            return
+        device_dir = os.path.dirname(cards[0])
+        card_dir = os.path.dirname(device_dir)
+
+        # Per-engine busy counters, where the driver exposes them
+        for busy in sorted(glob.glob(os.path.join(card_dir, 'engine/*/busy'))):
+            engine = os.path.basename(os.path.dirname(busy))
+            key = f'gpu_engine_{_clean_name(engine)}_percent'
+            if self._add(key, busy):
+                self._engine_keys.append(key)
+
+        # Frequency: multi-tile layout first (xe / newer i915), then the
+        # flat gt_*_freq_mhz files of classic i915
+        for name, key in (('act_freq_mhz', 'gpu_freq_actual_mhz'),
+                          ('cur_freq_mhz', 'gpu_freq_requested_mhz'),
+                          ('max_freq_mhz', 'gpu_freq_max_mhz')):
+            hits = sorted(glob.glob(os.path.join(device_dir, 'gt/gt*', name)))
+            if hits:
+                self._add(key, hits[0])
+            else:
+                self._add(key, os.path.join(card_dir, f'gt_{name}'))
+
+        # The GPU's own hwmon node lives under its device dir, so no
+        # scan of /sys/class/hwmon names is needed
+        for hwmon in sorted(glob.glob(os.path.join(device_dir, 'hwmon/hwmon*'))):
+            self._add('gpu_temp_temp1_c', os.path.join(hwmon, 'temp1_input'), 1e-3)
+            self._add('gpu_power_watts', os.path.join(hwmon, 'power1_average'), 1e-6)
+            self._add('gpu_fan_rpm', os.path.join(hwmon, 'fan1_input'))
+            break
+
+    def read(self):
+        """Samples every resolved field; returns a metric dict or None."""
+        stats = {}
+        for key, fd, scale in self._fields:
+            try:
+                raw = os.pread(fd, 64, 0)
+                stats[key] = int(raw) * scale if scale != 1.0 else int(raw)
+            except (OSError, ValueError):
+                pass
+        if self._engine_keys:
+            busy = [stats[k] for k in self._engine_keys if k in stats]
+            if busy:
+                stats['gpu_total_utilization_percent'] = sum(busy) / len(busy)
+        return stats or None
+
+    def close(self):
+        for _, fd, _ in self._fields:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fields = []
+        self._engine_keys = []
+
+
+class ParquetSink:
+    """Batched Parquet output for long capture sessions.
+
+    CSV re-encodes every float as ASCII and balloons over hours of
+    sub-second sampling; Parquet stores the same rows columnar and ~5x
+    smaller. Rows are buffered by the caller and arrive here a batch at a
+    time; the schema is fixed by the first batch.
+    """
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.writer = None
+
+    def write_batch(self, columns, rows):
+        table = self._to_table(columns, rows)
+        if self.writer is None:
+            self.writer = self._pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def flush(self):
+        """No-op: ParquetWriter owns its buffering and row-group layout."""
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def _to_table(self, columns, rows):
+        cols = {}
+        for i, name in enumerate(columns):
+            # Short rows (pre-widening) pad with None, as do the ''
+            # placeholders used for absent sensors in the CSV path
+            cols[name] = [None if (i >= len(r) or r[i] == '') else r[i]
+                          for r in rows]
+        if self.writer is None:
+            return self._pa.table(cols)
+        return self._pa.table(cols, schema=self.writer.schema)
+
+
+class BinarySink:
+    """Length-prefixed binary output for the highest sampling rates.
+
+    Layout: an 8-byte magic, a u32 length + JSON array of column names,
+    then fixed-width little-endian float64 rows. Rows skip per-field
+    ASCII formatting entirely and land ~10x smaller than CSV; a reader
+    needs only the schema header and numpy.fromfile (or struct.iter_unpack)
+    to recover the table. The timestamp column is stored as seconds since
+    the epoch and blank placeholders become NaN.
+    """
+
+    MAGIC = b'SYSMON1\x00'
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+        self._packer = None
+        self._width = 0
+
+    def write_batch(self, columns, rows):
+        if self._f is None:
+            self._f = open(self.path, 'wb', buffering=_FILE_BUFFER)
+            schema = json.dumps(columns).encode()
+            self._f.write(self.MAGIC)
+            self._f.write(struct.pack('<I', len(schema)))
+            self._f.write(schema)
+            self._packer = struct.Struct('<%dd' % len(columns))
+            self._width = len(columns)
+        pack = self._packer.pack
+        write = self._f.write
+        nan = float('nan')
+        for row in rows:
+            # Rows captured before a schema widening are narrower than
+            # the final column list; pad them with NaN, as the Parquet
+            # sink pads with None
+            if len(row) < self._width:
+                row = row + [nan] * (self._width - len(row))
+            write(pack(*map(self._field, row)))
+
+    def flush(self):
+        """Pushes buffered rows to disk so a hard kill loses at most a batch."""
+        if self._f is not None:
+            self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+
+    @staticmethod
+    def _field(value):
+        if isinstance(value, str):
+            if not value:
+                return float('nan')
+            return datetime.fromisoformat(value).timestamp()
+        return value
+
+
+def _rewrite_with_header(output_file, header):
+    """Rewrites the CSV with a widened header and returns a fresh handle.
+
+    Runs at most once per schema change (a rare event): existing rows are
+    copied under the new header into a temp file which atomically replaces
+    the original via os.replace, so a crash mid-rewrite can't lose data.
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_file))
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix='.csv')
+    try:
+        with os.fdopen(tmp_fd, 'w', newline='') as tmp:
+            tmp_writer = csv.writer(tmp)
+            tmp_writer.writerow(header)
+            with open(output_file, 'r', newline='') as old:
+                for i, row in enumerate(csv.reader(old)):
+                    # Skip the old, narrower header row
+                    if i == 0 and row and row[0] == 'timestamp':
+                        continue
+                    tmp_writer.writerow(row)
+        os.replace(tmp_path, output_file)
+    except BaseException:
         try:
-            os.remove(temp_file)
-        except:
+            os.unlink(tmp_path)
+        except OSError:
             pass
+        raise
+    return open(output_file, 'a', newline='', buffering=_FILE_BUFFER)
 
-        return gpu_stats if gpu_stats else None
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError, json.JSONDecodeError) as e:
-        return None
+class SensorCache:
+    """Throttled CPU-temperature and battery reads.
+
+    Both values move on the order of seconds while the sampling loop runs
+    sub-second, and each raw read walks /sys/class/hwmon or
+    /sys/class/power_supply (dozens of syscalls). Refresh them every
+    refresh_every seconds and serve the cached value in between.
+    """
+
+    # Preferred hwmon chip names, most specific first
+    TEMP_SENSORS = ("coretemp", "k10temp", "zenpower", "acpitz")
+
+    def __init__(self, interval, refresh_every=2.0):
+        self.refresh_ticks = max(1, int(refresh_every / interval))
+        self.temp_key = None
+        self.cached_temp = None
+        self.cached_battery = None
+
+    def cpu_temperature(self, tick):
+        """Returns the current CPU package temperature in °C, or None."""
+        if tick % self.refresh_ticks == 0:
+            self.cached_temp = self._read_cpu_temperature()
+        return self.cached_temp
+
+    def battery_percent(self, tick):
+        """Returns the battery charge percentage, or None without a battery."""
+        if tick % self.refresh_ticks == 0:
+            try:
+                battery = psutil.sensors_battery()
+            except (AttributeError, OSError):
+                battery = None
+            self.cached_battery = battery.percent if battery else None
+        return self.cached_battery
+
+    def _read_cpu_temperature(self):
+        try:
+            temps = psutil.sensors_temperatures()
+        except (AttributeError, OSError):
+            return None
+        if not temps:
+            return None
+
+        # Resolve the winning chip once so later reads skip the probe loop
+        if self.temp_key is None or self.temp_key not in temps:
+            for name in self.TEMP_SENSORS:
+                if temps.get(name):
+                    self.temp_key = name
+                    break
+            else:
+                self.temp_key = next(iter(temps))
+
+        entries = temps.get(self.temp_key)
+        return entries[0].current if entries else None
+
 
+class ProcSampler:
+    """CPU% and RSS for one PID straight from /proc, over kept-open fds.
 
-def monitor(target_identifier, output_file="system_metrics.csv", interval=0.5, use_qmassa=True):
+    psutil's cpu_percent/memory_info re-open /proc files and rebuild
+    result objects on every call, but the hot fields are just utime+stime
+    from /proc/<pid>/stat and the RSS page count from /proc/<pid>/statm.
+    Both files are opened once here and pread() each tick. psutil stays
+    for process lookup; sample() raises psutil.NoSuchProcess so the
+    loop's existing exit handling applies unchanged.
+    """
+
+    _CLK_TCK = os.sysconf('SC_CLK_TCK')
+    _PAGE_MB = os.sysconf('SC_PAGE_SIZE') * _MB
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        try:
+            self._statm_fd = os.open(f"/proc/{pid}/statm", os.O_RDONLY)
+        except OSError:
+            os.close(self._stat_fd)
+            raise
+        self._prev_cpu_time = None
+        self._prev_t = None
+
+    def sample(self):
+        """Returns (cpu_percent, rss_mb); the first call reports 0.0 CPU."""
+        try:
+            stat = os.pread(self._stat_fd, 512, 0)
+            statm = os.pread(self._statm_fd, 128, 0)
+        except OSError:
+            raise psutil.NoSuchProcess(self.pid)
+        if not stat or not statm:
+            raise psutil.NoSuchProcess(self.pid)
+
+        # comm can contain spaces, so split after the ')' that ends it;
+        # utime and stime are then fields 11 and 12
+        fields = stat.rsplit(b')', 1)[1].split()
+        cpu_time = (int(fields[11]) + int(fields[12])) / self._CLK_TCK
+
+        now = time.monotonic()
+        if self._prev_cpu_time is None:
+            cpu_pct = 0.0
+        else:
+            dt = now - self._prev_t
+            cpu_pct = 100.0 * (cpu_time - self._prev_cpu_time) / dt if dt > 0 else 0.0
+        self._prev_cpu_time = cpu_time
+        self._prev_t = now
+
+        return round(cpu_pct, 1), int(statm.split()[1]) * self._PAGE_MB
+
+    def close(self):
+        os.close(self._stat_fd)
+        os.close(self._statm_fd)
+
+
+# Runtime-PM state of the first drm card; 'suspended' means the GPU has
+# been idle long enough for the kernel to power it down, so there is
+# nothing new to sample. The fd is opened lazily and kept (-1 = no card).
+_runtime_status_fd = None
+
+
+def _gpu_idle_hint():
+    """True when the GPU is runtime-suspended and sampling can be skipped."""
+    global _runtime_status_fd
+    if _runtime_status_fd is None:
+        try:
+            _runtime_status_fd = os.open(
+                '/sys/class/drm/card0/device/power/runtime_status', os.O_RDONLY)
+        except OSError:
+            _runtime_status_fd = -1
+    if _runtime_status_fd < 0:
+        return False
+    try:
+        return os.pread(_runtime_status_fd, 16, 0).strip() == b'suspended'
+    except OSError:
+        return False
+
+
+# Published in place of a snapshot when the qmassa child exits; the main
+# loop demotes to CPU-only sampling when it sees this
+_GPU_SOURCE_DEAD = object()
+
+
+def _gpu_worker(temp_file, snapshot, lock, interval, proc):
+    """Daemon worker that publishes the freshest qmassa snapshot.
+
+    The main loop never blocks on qmassa this way; it reads the latest
+    (stats, monotonic timestamp) pair and keeps using the previous one
+    when nothing fresher has landed. Staleness is bounded by one qmassa
+    refresh even if a read hangs.
+    """
+    while True:
+        # A dead child (e.g. 'sudo -n' refused without passwordless sudo)
+        # will never refresh the file again; tell the main loop rather
+        # than leaving it waiting on a snapshot that can't arrive
+        if proc.poll() is not None:
+            with lock:
+                snapshot[0] = _GPU_SOURCE_DEAD
+            return
+
+        # One 16-byte pread decides whether the read is worth doing at
+        # all: a runtime-suspended GPU can't have produced new numbers,
+        # and the previously published snapshot stays valid
+        if _gpu_idle_hint():
+            time.sleep(interval)
+            continue
+
+        gpu_stats = get_gpu_stats_qmassa(temp_file)
+        if gpu_stats is None:
+            # No snapshot yet (qmassa still starting, or failed); back off
+            time.sleep(0.5)
+            continue
+
+        with lock:
+            snapshot[0] = (gpu_stats, time.monotonic())
+
+        # The tail-read itself is microseconds; pace the worker to the
+        # qmassa refresh interval instead of spinning on the file
+        time.sleep(interval)
+
+
+def _format_csv_rows(rows):
+    """Preformats row lists as CSV lines for one writelines() call.
+
+    Every field is a timestamp or a number, so the csv module's per-field
+    quoting state machine is pure overhead; a join per row is all the
+    formatting the data needs.
+    """
+    return [','.join(map(str, row)) + '\n' for row in rows]
+
+
+def _writer_loop(q, write_rows, flush, error):
+    """Drains sampled rows off the bounded queue and writes them in batches.
+
+    Runs on its own thread so disk latency never lands inside the sampling
+    period. Everything queued while a write was in flight is gathered into
+    the next batch, and the file is only flushed once the queue runs dry.
+    A None sentinel ends the loop; any write failure — OSError from the
+    disk, but also sink-level errors like an Arrow schema mismatch — is
+    recorded in error for the sampler to raise, rather than dying
+    silently while rows keep getting shed.
+    """
+    stop = False
+    while not stop:
+        row = q.get()
+        if row is None:
+            break
+        batch = [row]
+        while True:
+            try:
+                row = q.get_nowait()
+            except queue.Empty:
+                break
+            if row is None:
+                stop = True
+                break
+            batch.append(row)
+        try:
+            write_rows(batch)
+            flush()
+        except Exception as e:
+            error.append(e)
+            return
+
+
+def monitor(target_identifier, output_file="system_metrics.csv", interval=0.5,
+            use_qmassa=True, output_format="csv", gpu_interval=1.0):
     """
     Monitors CPU, RAM, and GPU utilization for a target process.
 
     Args:
         target_identifier: PID (int) or process name (str) to monitor
-        output_file: CSV file path for output metrics
-        interval: Sampling interval in seconds
+        output_file: Output file path for metrics
+        interval: Sampling interval in seconds for CPU/RAM
         use_qmassa: Whether to use qmassa for GPU monitoring
+        output_format: 'csv', 'parquet' (needs pyarrow; falls back to
+            csv) or 'bin' (packed float64 rows behind a JSON schema header)
+        gpu_interval: GPU sampling interval in seconds; GPU stats cost far
+            more than the /proc reads, so they run on their own coarser
+            cadence and rows in between repeat the latest snapshot
     """
+    # timeout/systemd/kill deliver SIGTERM, whose default disposition
+    # skips the finally block below — leaving the long-lived qmassa child
+    # orphaned, the sink buffer unwritten and the temp file behind.
+    # Convert it to a normal exit so the cleanup path runs.
+    try:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(143))
+    except ValueError:
+        # Not on the main thread; leave the default disposition alone
+        pass
+
+    if output_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("⚠️ pyarrow not installed; falling back to CSV output.")
+            output_format = 'csv'
     # --- Find Target Process (CPU/RAM) ---
     try:
         pid = int(target_identifier)
@@ -162,107 +810,408 @@ def monitor(target_identifier, output_file="system_metrics.csv", interval=0.5, u
 
     print(f"📊 Monitoring Process: {process.name()} (PID: {process.pid})")
 
+    # Per-tick sampling bypasses psutil from here on: two pread() calls on
+    # fds opened once beat re-opening /proc files every tick
+    try:
+        proc_sampler = ProcSampler(process.pid)
+    except OSError:
+        print(f"❌ Process {process.pid} exited before monitoring started.", file=sys.stderr)
+        return 1
+
     # --- Check for GPU Monitor ---
     has_gpu_monitor = False
     gpu_temp_file = None
+    qmassa_proc = None
+    sysfs_gpu = None
 
     if use_qmassa:
+        # Prefer direct sysfs reads: no subprocess, no sudo, and each GPU
+        # sample is a few pread() calls instead of a JSON round-trip
+        probe = SysfsGpu()
+        if probe.available:
+            sysfs_gpu = probe
+            has_gpu_monitor = True
+            print("✅ Reading GPU stats directly from sysfs (qmassa not needed).")
+        else:
+            probe.close()
+
+    if use_qmassa and sysfs_gpu is None:
         qmassa_path = shutil.which("qmassa")
         if qmassa_path:
-            print("✅ 'qmassa' found. Starting GPU monitoring with qmassa.")
-            # Create temp file for qmassa JSON output
-            gpu_temp_file = os.path.join(tempfile.gettempdir(), f"qmassa_monitor_{os.getpid()}.json")
-            has_gpu_monitor = True
+            # Launch qmassa once; it keeps refreshing the JSON file at the
+            # requested interval, so no per-sample fork/exec/sudo is needed
+            # Prefer tmpfs so qmassa's constant JSON rewrites stay in RAM
+            # instead of churning disk writeback
+            temp_dir = '/dev/shm' if os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+            gpu_temp_file = os.path.join(temp_dir, f"qmassa_monitor_{os.getpid()}.json")
+            qmassa_proc = start_qmassa(gpu_temp_file, gpu_interval)
+            if qmassa_proc is not None:
+                print("✅ 'qmassa' found. Starting GPU monitoring with qmassa.")
+                has_gpu_monitor = True
+                # Belt and braces: the finally below unlinks on clean
+                # shutdown, atexit covers exits that bypass it
+                atexit.register(_unlink_quiet, gpu_temp_file)
+            else:
+                print("⚠️ Failed to start 'qmassa'. Monitoring CPU/RAM only.")
+                gpu_temp_file = None
         else:
             print("⚠️ 'qmassa' not found. Install with: cargo install --locked qmassa")
             print("⚠️ Monitoring CPU/RAM only.")
 
+    # --- Start GPU worker ---
+    gpu_snapshot = None
+    gpu_lock = threading.Lock()
+    if has_gpu_monitor and gpu_temp_file:
+        gpu_snapshot = [None]
+        threading.Thread(target=_gpu_worker,
+                         args=(gpu_temp_file, gpu_snapshot, gpu_lock,
+                               gpu_interval, qmassa_proc),
+                         daemon=True).start()
+
     # --- Setup CSV Logging ---
     file_exists = os.path.isfile(output_file)
 
-    # Determine CSV headers
-    header = ["timestamp", "cpu_percent", "memory_mb"]
+    # Determine CSV headers. sample_interval_s records the interval each
+    # row was captured at, so consumers can un-bin adaptively sampled data.
+    header = ["timestamp", "cpu_percent", "memory_mb", "cpu_temp_c",
+              "battery_percent", "sample_interval_s"]
 
-    # We'll add GPU columns dynamically on first GPU stats capture
-    gpu_columns_added = False
+    # Temperature/battery barely change between sub-second ticks; serve
+    # them from a throttled cache
+    sensors = SensorCache(interval)
+    tick = 0
+
+    # GPU columns are discovered dynamically, but only until the schema has
+    # held stable for SCHEMA_WARMUP captures; after that the per-tick drift
+    # check is skipped entirely.
+    SCHEMA_WARMUP = 5
     all_gpu_keys = []
+    gpu_key_set = set()
+    schema_frozen = False
+    stable_captures = 0
+
+    # Without a GPU source the column set can't change, so it is final now;
+    # with one, the fixed columns go into the header immediately and only
+    # device-specific names can still widen it
+    if gpu_snapshot is None and sysfs_gpu is None:
+        schema_frozen = True
+    else:
+        all_gpu_keys.extend(GPU_COLUMNS)
+        gpu_key_set.update(GPU_COLUMNS)
+        header.extend(GPU_COLUMNS)
 
+    use_sink = output_format in ('parquet', 'bin')
+    f = None
+    sink = None
     try:
-        with open(output_file, 'a', newline='') as f:
-            writer = csv.writer(f)
+        # Rows accumulate in memory and hit the file as one writelines()
+        # per batch, so the per-sample cost is a single list.append.
+        BATCH_ROWS = 32
+        pending_rows = []
+
+        # Writer thread, started once the schema freezes (its file handle
+        # and schema must be final); until then rows stay in pending_rows
+        # so a header rewrite can drain them first
+        row_q = None
+        writer_thread = None
+        writer_error = []
+
+        # Keys that appeared after a sink schema was already on disk and
+        # had to be dropped; tracked so each is only warned about once
+        dropped_keys = set()
+
+        if output_format == 'parquet':
+            sink = ParquetSink(output_file)
+        elif output_format == 'bin':
+            sink = BinarySink(output_file)
+        else:
+            f = open(output_file, 'a', newline='', buffering=_FILE_BUFFER)
 
             if not file_exists:
-                writer.writerow(header)
+                f.write(','.join(header) + '\n')
 
-            # Initialize CPU measurement (first call returns 0.0)
-            process.cpu_percent(interval=None)
+        # Initialize CPU measurement: prime the utime/stime baseline, then
+        # give it a real (if small) window before the loop's first sample.
+        # A near-zero wall-clock delta amplifies jiffy granularity into
+        # spurious spikes (or >100% readings) on the first logged row.
+        proc_sampler.sample()
+        time.sleep(min(interval, 0.05))
 
-            print(f"📝 Logging to: {output_file}")
-            print("Press Ctrl+C to stop monitoring\n")
+        print(f"📝 Logging to: {output_file}")
+        print("Press Ctrl+C to stop monitoring\n")
 
-            try:
-                while True:
-                    # 1. Get CPU and Memory usage from psutil
+        # Absolute-deadline scheduling: sleeping a fixed interval after the
+        # work would stretch the period by the work time and skew the
+        # wall-clock deltas psutil.cpu_percent is computed over
+        next_tick = time.monotonic()
+
+        # Adaptive cadence: when CPU and GPU readings have been flat for
+        # STABLE_TICKS in a row the interval doubles (up to max_interval),
+        # halving the monitor's own cost on idle hosts; the first reading
+        # that moves past the thresholds snaps back to the base interval.
+        base_interval = interval
+        max_interval = base_interval * 8
+        cur_interval = base_interval
+        STABLE_TICKS = 5
+        CPU_DELTA = 1.0
+        GPU_DELTA = 2.0
+        prev_cpu = None
+        prev_gpu_pct = None
+        stable_run = 0
+
+        # Preallocated zero tail for the GPU columns plus a key -> row
+        # index map, rebuilt only on the rare schema widening; rows extend
+        # from the tail with one slice copy instead of allocating a fresh
+        # [0.0] * n list every tick, and stats scatter through the map
+        fixed_fields = len(header) - len(all_gpu_keys)
+        gpu_zero_tail = [0.0] * len(all_gpu_keys)
+        gpu_idx = {k: fixed_fields + i for i, k in enumerate(all_gpu_keys)}
+
+        # Next sysfs GPU sample deadline and the snapshot reused until then
+        gpu_due = time.monotonic()
+        last_gpu_stats = None
+
+        try:
+            while True:
+                # 1. Get CPU and Memory usage from the /proc fds
+                try:
+                    cpu_util, mem_mb = proc_sampler.sample()
+                except psutil.NoSuchProcess:
+                    print("\n✅ Target process terminated.")
+                    break
+
+                cpu_temp = sensors.cpu_temperature(tick)
+                battery = sensors.battery_percent(tick)
+                tick += 1
+
+                row_data = [_fast_timestamp(), cpu_util, round(mem_mb, 2),
+                            cpu_temp if cpu_temp is not None else '',
+                            battery if battery is not None else '',
+                            cur_interval]
+
+                # 2. Sample the GPU on its own coarser cadence: sysfs
+                # inline when due (rows in between reuse the last
+                # snapshot), otherwise the latest snapshot the qmassa
+                # worker published
+                gpu_stats = None
+                if sysfs_gpu is not None:
+                    now = time.monotonic()
+                    if now >= gpu_due:
+                        last_gpu_stats = sysfs_gpu.read()
+                        gpu_due = now + gpu_interval
+                    gpu_stats = last_gpu_stats
+                elif gpu_snapshot is not None:
+                    with gpu_lock:
+                        published = gpu_snapshot[0]
+                    if published is _GPU_SOURCE_DEAD:
+                        # qmassa exited; demote to CPU-only and freeze the
+                        # schema as it stands so sink formats start
+                        # flushing instead of buffering forever
+                        print("⚠️ qmassa exited; continuing with CPU/RAM only.")
+                        gpu_snapshot = None
+                        has_gpu_monitor = False
+                        schema_frozen = True
+                    else:
+                        gpu_stats = published[0] if published is not None else None
+
+                if has_gpu_monitor:
+                    if gpu_stats:
+                        # A key can surface after warm-up (e.g. a sensor
+                        # that only reports under load). CSV can still
+                        # widen: unfreeze and let the rewrite machinery
+                        # below handle it. Parquet/bin schemas are already
+                        # on disk and can't, so say what is being dropped
+                        # instead of discarding it silently.
+                        if schema_frozen and not gpu_key_set.issuperset(gpu_stats):
+                            if use_sink:
+                                for key in gpu_stats:
+                                    if key not in gpu_key_set and key not in dropped_keys:
+                                        dropped_keys.add(key)
+                                        print(f"⚠️ Column '{key}' appeared after the "
+                                              f"{output_format} schema froze; dropping it.")
+                            else:
+                                # The writer thread holds the file handle;
+                                # stop it before the rewrite, restart after
+                                # the schema refreezes
+                                if row_q is not None:
+                                    while writer_thread.is_alive():
+                                        try:
+                                            row_q.put(None, timeout=1)
+                                            break
+                                        except queue.Full:
+                                            pass
+                                    writer_thread.join(timeout=5)
+                                    row_q = None
+                                    writer_thread = None
+                                schema_frozen = False
+                                stable_captures = 0
+
+                        if not schema_frozen:
+                            new_keys = [k for k in gpu_stats if k not in gpu_key_set]
+                            if new_keys:
+                                new_keys.sort()
+                                all_gpu_keys.extend(new_keys)
+                                gpu_key_set.update(new_keys)
+                                header.extend(new_keys)
+
+                                # Rewrite the CSV under the widened header
+                                # via temp file + atomic replace, then carry
+                                # on with a fresh handle. Rare: once per
+                                # schema change. The Parquet sink buffers
+                                # until the schema freezes, so it has
+                                # nothing on disk to rewrite.
+                                if not use_sink:
+                                    if pending_rows:
+                                        f.writelines(_format_csv_rows(pending_rows))
+                                        pending_rows.clear()
+                                    f.close()
+                                    f = _rewrite_with_header(output_file, header)
+                                gpu_zero_tail = [0.0] * len(all_gpu_keys)
+                                gpu_idx = {k: fixed_fields + i
+                                           for i, k in enumerate(all_gpu_keys)}
+                                stable_captures = 0
+                            else:
+                                stable_captures += 1
+                                if stable_captures >= SCHEMA_WARMUP:
+                                    schema_frozen = True
+
+                        # Add GPU values in consistent order: copy the
+                        # zero tail, then scatter the stats that exist
+                        # through the index map — O(len(gpu_stats)) with
+                        # no per-column .get() + append
+                        row_data += gpu_zero_tail
+                        for key, val in gpu_stats.items():
+                            idx = gpu_idx.get(key)
+                            if idx is not None:
+                                row_data[idx] = val
+                    else:
+                        # No GPU stats, append zeros
+                        row_data += gpu_zero_tail
+
+                # 3. Hand the row off. Once the schema is frozen a writer
+                # thread owns the file and disk latency moves off this
+                # thread entirely; during warm-up rows buffer locally so a
+                # header rewrite can drain them first.
+                if schema_frozen and row_q is None:
+                    row_q = queue.Queue(maxsize=1024)
+                    if use_sink:
+                        write_rows = lambda rows: sink.write_batch(header, rows)
+                        flush = sink.flush
+                    else:
+                        # Formatting happens on the writer thread too, so
+                        # the sampler hands over raw lists
+                        write_rows = lambda rows: f.writelines(_format_csv_rows(rows))
+                        flush = f.flush
+                    writer_thread = threading.Thread(
+                        target=_writer_loop,
+                        args=(row_q, write_rows, flush, writer_error),
+                        daemon=True)
+                    writer_thread.start()
+                    for row in pending_rows:
+                        row_q.put(row)
+                    pending_rows.clear()
+
+                if row_q is not None:
+                    if writer_error:
+                        # The writer thread died on a write error; surface
+                        # it instead of silently shedding every row for
+                        # the rest of the run
+                        raise writer_error[0]
                     try:
-                        cpu_util = process.cpu_percent(interval=None)
-                        mem_mb = process.memory_info().rss / (1024 * 1024)
-                    except psutil.NoSuchProcess:
-                        print("\n✅ Target process terminated.")
+                        row_q.put_nowait(row_data)
+                    except queue.Full:
+                        # Disk stalled long enough to back up 1024 rows;
+                        # shed this sample rather than stall the sampler
+                        pass
+                else:
+                    pending_rows.append(row_data)
+                    if len(pending_rows) >= BATCH_ROWS and not use_sink:
+                        f.writelines(_format_csv_rows(pending_rows))
+                        f.flush()
+                        pending_rows.clear()
+
+                # Compare against the previous tick and widen or reset the
+                # interval accordingly
+                gpu_pct = gpu_stats.get('gpu_total_utilization_percent', 0.0) if gpu_stats else 0.0
+                if (prev_cpu is not None
+                        and abs(cpu_util - prev_cpu) < CPU_DELTA
+                        and abs(gpu_pct - prev_gpu_pct) < GPU_DELTA):
+                    stable_run += 1
+                    if stable_run >= STABLE_TICKS:
+                        cur_interval = min(cur_interval * 2, max_interval)
+                        stable_run = 0
+                else:
+                    stable_run = 0
+                    cur_interval = base_interval
+                prev_cpu = cpu_util
+                prev_gpu_pct = gpu_pct
+
+                # Sleep to the next absolute deadline; if we fell behind,
+                # realign instead of bursting to catch up
+                next_tick += cur_interval
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.monotonic()
+
+        except KeyboardInterrupt:
+            print("\n✅ Monitoring stopped by user.")
+        finally:
+            # Stop the writer thread after a final drain of its queue. It
+            # may have died with the queue still full, so never block
+            # forever handing it the sentinel.
+            if row_q is not None:
+                while writer_thread.is_alive():
+                    try:
+                        row_q.put(None, timeout=1)
                         break
+                    except queue.Full:
+                        pass
+                writer_thread.join(timeout=5)
+
+            # Drain whatever is still buffered so shutdown loses no rows
+            if pending_rows and not writer_error:
+                if use_sink:
+                    sink.write_batch(header, pending_rows)
+                else:
+                    f.writelines(_format_csv_rows(pending_rows))
+                pending_rows.clear()
 
-                    row_data = [datetime.now().isoformat(), cpu_util, round(mem_mb, 2)]
-
-                    # 2. Get GPU stats if qmassa is available
-                    if has_gpu_monitor and gpu_temp_file:
-                        gpu_stats = get_gpu_stats_qmassa(gpu_temp_file)
-
-                        if gpu_stats:
-                            # On first successful GPU capture, update CSV header
-                            if not gpu_columns_added:
-                                all_gpu_keys = sorted(gpu_stats.keys())
-                                header.extend(all_gpu_keys)
-
-                                # Rewrite header if file is new or recreate with new header
-                                if file_exists:
-                                    # File exists but we need to add GPU columns
-                                    # Just add them to current header for new rows
-                                    pass
-                                else:
-                                    # Rewrite header with GPU columns
-                                    f.seek(0)
-                                    writer.writerow(header)
-
-                                gpu_columns_added = True
-
-                            # Add GPU values in consistent order
-                            for key in all_gpu_keys:
-                                row_data.append(gpu_stats.get(key, 0.0))
-                        else:
-                            # No GPU stats, append zeros
-                            if gpu_columns_added:
-                                row_data.extend([0.0] * len(all_gpu_keys))
-
-                    # 3. Write data to CSV
-                    writer.writerow(row_data)
-                    f.flush()
-
-                    # Sleep to maintain the desired interval
-                    time.sleep(interval)
-
-            except KeyboardInterrupt:
-                print("\n✅ Monitoring stopped by user.")
-
-    except IOError as e:
+            # A write failure discovered at shutdown still ends the run
+            # with the error printed and exit code 1
+            if writer_error:
+                raise writer_error[0]
+
+    except Exception as e:
+        # Direct file IO errors and anything surfaced from the writer
+        # thread — which can raise more than OSError, e.g. an Arrow
+        # schema mismatch — end the run the same way
         print(f"❌ Error writing to {output_file}: {e}", file=sys.stderr)
         return 1
 
     finally:
-        # Clean up temp file
-        if gpu_temp_file and os.path.exists(gpu_temp_file):
+        if sink is not None:
+            sink.close()
+        if f is not None:
+            f.close()
+
+        proc_sampler.close()
+
+        if sysfs_gpu is not None:
+            sysfs_gpu.close()
+
+        # Stop the qmassa child
+        if qmassa_proc is not None:
+            qmassa_proc.terminate()
             try:
-                os.remove(gpu_temp_file)
-            except:
-                pass
+                qmassa_proc.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                qmassa_proc.kill()
+
+        # Clean up temp file; unlink directly rather than stat-then-remove
+        if gpu_temp_file:
+            _unlink_quiet(gpu_temp_file)
 
     return 0
 
@@ -298,16 +1247,31 @@ Examples:
         default=0.5,
         help="Monitoring interval in seconds (default: 0.5)"
     )
+    parser.add_argument(
+        "--gpu-interval",
+        type=float,
+        default=1.0,
+        help="GPU sampling interval in seconds; rows between GPU samples repeat the latest snapshot (default: 1.0)"
+    )
     parser.add_argument(
         "--no-gpu",
         action="store_true",
         help="Disable GPU monitoring (CPU/RAM only)"
     )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet", "bin"],
+        default="csv",
+        help="Output format; parquet needs pyarrow, bin writes packed "
+             "float64 rows behind a JSON schema header (default: csv)"
+    )
 
     args = parser.parse_args()
 
     use_qmassa = not args.no_gpu
-    exit_code = monitor(args.target, output_file=args.out, interval=args.interval, use_qmassa=use_qmassa)
+    exit_code = monitor(args.target, output_file=args.out, interval=args.interval,
+                        use_qmassa=use_qmassa, output_format=args.format,
+                        gpu_interval=args.gpu_interval)
     sys.exit(exit_code)
 
 